@@ -27,18 +27,22 @@ from automua import log
 from automua.util import from_environ
 
 # Changing config keys will break existing end user config files.
+CONF_CACHE_TTL = 'cache_ttl'
 CONF_DB_ECHO = 'db_echo'
 CONF_DB_URI = 'db_uri'
 CONF_LOGLEVEL = 'loglevel'
 CONF_PROXY_COUNT = 'proxy_count'
+CONF_WARM_UP = 'warm_up'
 
 # Default values will be overridden by user-defined values.
 _DEFAULT_CONF = {
     IDENTIFIER: {
+        CONF_CACHE_TTL: 60,
         CONF_DB_ECHO: 'no',
         CONF_DB_URI: 'sqlite:///:memory:',
         CONF_LOGLEVEL: 'WARNING',
         CONF_PROXY_COUNT: 0,
+        CONF_WARM_UP: 'no',
     }
 }
 
@@ -81,6 +85,9 @@ class Config:
         log.debug(f'Config.get_int: {option} = {value}')
         return value
 
+    def cache_ttl(self) -> int:
+        return self.get_int(CONF_CACHE_TTL)
+
     def db_echo(self) -> bool:
         return self.get_bool(CONF_DB_ECHO)
 
@@ -93,6 +100,9 @@ class Config:
     def proxy_count(self) -> int:
         return self.get_int(CONF_PROXY_COUNT)
 
+    def warm_up(self) -> bool:
+        return self.get_bool(CONF_WARM_UP)
+
 
 config = Config()
 log.setLevel(config.loglevel())
@@ -27,12 +27,20 @@ from xml.etree.ElementTree import tostring
 from automua import IDENTIFIER
 from automua import LdapLookupError
 from automua import LdapNoMatch
+from automua import ldap_pool
+from automua.config import config
 from automua.ldap import LdapAccess
 from automua.ldap import LookupResult
 from automua.ldap import STATUS_ERROR
 from automua.ldap import STATUS_NO_MATCH
 from automua.model import Ldapserver
 from automua.model import Server
+from automua.model import data_generation
+from automua.util import TtlCache
+from automua.util import format_search_filter
+
+# (LDAP server ID, email address) -> LookupResult
+_ldap_cache = TtlCache(4096, config.cache_ttl())
 
 
 def branded_id(id_) -> str:
@@ -51,12 +59,25 @@ class ConfigGenerator:
     def ldap_lookup(email_address: str, server: Ldapserver) -> LookupResult:
         if not (server and server.name):
             raise LdapLookupError('No LDAP server specified')
-        ldap = LdapAccess(server.name, port=server.port, use_ssl=server.use_ssl,
-                          user=server.bind_user, password=server.bind_password)
-        r = ldap.lookup(server.search_base, server.search_filter.format(email_address),
-                        attr_cn=server.attr_cn, attr_uid=server.attr_uid)
+        key = (server.id, email_address)
+        generation = data_generation()
+        r = _ldap_cache.get(key, generation)
+        if r is None:
+            digest = ldap_pool.fingerprint(server.name, server.port, server.use_ssl, server.bind_user,
+                                           server.bind_password)
+
+            def connect() -> LdapAccess:
+                return LdapAccess(server.name, port=server.port, use_ssl=server.use_ssl,
+                                  user=server.bind_user, password=server.bind_password, persistent=True)
+
+            r = ldap_pool.lookup(server.id, digest, connect, server.search_base,
+                                 format_search_filter(server.search_filter, email_address),
+                                 attr_cn=server.attr_cn, attr_uid=server.attr_uid)
+            if r.status != STATUS_ERROR:
+                # Matches and non-matches are both cached, errors are not.
+                _ldap_cache.put(key, generation, r)
         if r.status == STATUS_ERROR:  # pragma: no cover
-            raise LdapLookupError('LDAP bind failed')
+            raise LdapLookupError('LDAP lookup failed')
         elif r.status == STATUS_NO_MATCH:  # pragma: no cover
             raise LdapNoMatch(f'No LDAP match for <{email_address}>')
         return r
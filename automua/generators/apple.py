@@ -20,25 +20,40 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with automua. If not, see <https://www.gnu.org/licenses/>.
 """
+import re
+from collections import namedtuple
+from functools import lru_cache
+from io import BytesIO
 from typing import List
-from xml.etree.ElementTree import Element
-from xml.etree.ElementTree import SubElement
+from typing import Tuple
+from xml.sax.saxutils import escape
 
+from sqlalchemy import bindparam
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import lazyload
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm import selectinload
+
+from automua import AutoMuaException
 from automua import DomainNotFound
 from automua import InvalidAuthenticationType
 from automua import NoProviderForDomain
 from automua import NoServersForDomain
+from automua import log
+from automua.config import config
 from automua.generators import ConfigGenerator
 from automua.generators import branded_id
-from automua.generators import xml_to_string
 from automua.ldap import LookupResult
 from automua.ldap import STATUS_SUCCESS
 from automua.model import Domain
 from automua.model import Provider
 from automua.model import Server
+from automua.model import data_generation
+from automua.model import db
+from automua.util import TtlCache
 from automua.util import expand_placeholders
 from automua.util import socket_type_needs_tls
-from automua.util import strip_none_values
 from automua.util import unique
 
 AUTH_MAP = {
@@ -51,102 +66,270 @@ SERVER_TYPE_MAP = {
     'pop': ['Incoming', 'EmailTypePOP'],
     'smtp': ['Outgoing', None],
 }
+# Per server type: plist keys for host name, port, user name, authentication and TLS usage.
+SERVER_TYPE_KEYS = {
+    type_: tuple(f'{direction}MailServer{suffix}'
+                 for suffix in ('HostName', 'PortNumber', 'Username', 'Authentication', 'UseSSL'))
+    for type_, (direction, _) in SERVER_TYPE_MAP.items()
+}
+
+# Sentinels standing in for per-request values inside cached plist templates.
+TEMPLATE_LOCAL = '{{LOCAL}}'
+TEMPLATE_REALNAME = '{{REALNAME}}'
+TEMPLATE_UID = '{{UID}}'
+TEMPLATE_ACCOUNT_UUID = '{{ACCOUNT_UUID}}'
+TEMPLATE_CONFIG_UUID = '{{CONFIG_UUID}}'
+_TEMPLATE_LOCAL_B = TEMPLATE_LOCAL.encode()
+_TEMPLATE_REALNAME_B = TEMPLATE_REALNAME.encode()
+_TEMPLATE_UID_B = TEMPLATE_UID.encode()
+_TEMPLATE_ACCOUNT_UUID_B = TEMPLATE_ACCOUNT_UUID.encode()
+_TEMPLATE_CONFIG_UUID_B = TEMPLATE_CONFIG_UUID.encode()
+_template_re = re.compile(rb'\{\{(?:LOCAL|REALNAME|UID|ACCOUNT_UUID|CONFIG_UUID)\}\}')
+_TEMPLATE_CACHE_SIZE = 256
+
+# Domain name -> Domain
+_domain_cache = TtlCache(1024, config.cache_ttl())
+
+# Built once so that SQLAlchemy can reuse the compiled form from its statement cache.
+_DOMAIN_STMT = select(Domain).options(
+    load_only(Domain.id, Domain.name),
+    joinedload(Domain.provider),
+    selectinload(Domain.servers).options(lazyload(Server.domains)),
+    joinedload(Domain.ldapserver),
+).where(Domain.name == bindparam('name'))
+
+# Server attributes which affect the generated plist, in a hashable form.
+ServerKey = namedtuple('ServerKey', 'type name port user_name authentication socket_type')
+
+_PLIST_OPEN = b'<plist version="1.0">'
+_PLIST_CLOSE = b'</plist>'
+_KEY_OPEN = b'<key>'
+_KEY_CLOSE = b'</key>'
+_TRUE = b'<true/>'
+_FALSE = b'<false/>'
+_BOOL_BYTES = {True: _TRUE, False: _FALSE}
+
+
+def _key_element(buf: BytesIO, key: str):
+    fragment = _KEY_BYTES.get(key)
+    if fragment is None:
+        fragment = _KEY_OPEN + _xml_text(key) + _KEY_CLOSE
+    buf.write(fragment)
+
+
+def _bool_element(buf: BytesIO, key: str, value: bool):
+    _key_element(buf, key)
+    buf.write(_BOOL_BYTES[value])
+
+
+def _int_element(buf: BytesIO, key: str, value: int):
+    _key_element(buf, key)
+    buf.write(b'<integer>')
+    buf.write(str(value).encode('ascii'))
+    buf.write(b'</integer>')
 
 
-def _bool_element(parent: Element, key: str, value: bool):
-    SubElement(parent, 'key').text = key
-    if value:
-        v = 'true'
-    else:
-        v = 'false'
-    SubElement(parent, v)
+def _str_element(buf: BytesIO, key: str, value: str):
+    _key_element(buf, key)
+    buf.write(b'<string>')
+    buf.write(_xml_text(value))
+    buf.write(b'</string>')
 
 
-def _int_element(parent: Element, key: str, value: int):
-    SubElement(parent, 'key').text = key
-    SubElement(parent, 'integer').text = str(value)
+# Emitters by value tag: 'b' bool, 'i' integer, 's' string. Tags 'x' (string which may contain placeholders)
+# and 'L' (array of dicts) are handled by _emit().
+_TAGGED_ELEMENTS = {
+    'b': _bool_element,
+    'i': _int_element,
+    's': _str_element,
+}
 
 
-def _str_element(parent: Element, key: str, value: str):
-    SubElement(parent, 'key').text = key
-    SubElement(parent, 'string').text = value
+def _emit(buf: BytesIO, items: list, local: str, domain: str):
+    """Serialize a list of (key, tag, value) triples as a plist dict straight into a byte buffer,
+    without building an element tree. Placeholders are expanded in values tagged 'x'.
+    """
+    # Walk the payload with an explicit stack. Children are pushed in reverse so they are emitted in order,
+    # closing tags are pushed as bytes to be written once all children are done.
+    buf.write(b'<dict>')
+    stack = [b'</dict>']
+    stack.extend(reversed(items))
+    while stack:
+        item = stack.pop()
+        if type(item) is bytes:
+            buf.write(item)
+            continue
+        key, tag, value = item
+        if tag == 'x':
+            _str_element(buf, key, expand_placeholders(value, local, domain))
+        elif tag == 'L':
+            _key_element(buf, key)
+            buf.write(b'<array>')
+            stack.append(b'</array>')
+            for member in reversed(value):
+                stack.append(b'</dict>')
+                stack.extend(reversed(member))
+                stack.append(b'<dict>')
+        else:
+            _TAGGED_ELEMENTS[tag](buf, key, value)
 
 
-def _subtree(parent: Element, key: str, value):
-    if isinstance(value, bool):
-        _bool_element(parent, key, value)
-    elif isinstance(value, dict):
-        p = SubElement(parent, 'dict')
-        for k, v in value.items():
-            _subtree(p, k, v)
-    elif isinstance(value, int):
-        _int_element(parent, key, value)
-    elif isinstance(value, list):
-        SubElement(parent, 'key').text = key
-        p = SubElement(parent, 'array')
-        for v in value:
-            _subtree(p, 'dunno', v)
-    else:
-        _str_element(parent, key, value)
+# Payload skeletons in plist key order. Values set to None here are filled in per account.
+_ACCOUNT_PAYLOAD = {
+    'EmailAccountDescription': None,
+    'EmailAccountName': None,
+    'EmailAccountType': None,
+    'EmailAddress': None,
+    'IncomingMailServerAuthentication': 'EmailAuthPassword',
+    'IncomingMailServerHostName': None,
+    'IncomingMailServerPortNumber': -1,
+    'IncomingMailServerUseSSL': None,
+    'IncomingMailServerUsername': None,
+    'OutgoingMailServerAuthentication': 'EmailAuthPassword',
+    'OutgoingMailServerHostName': None,
+    'OutgoingMailServerPortNumber': -1,
+    'OutgoingMailServerUseSSL': None,
+    'OutgoingMailServerUsername': None,
+    'OutgoingPasswordSameAsIncomingPassword': True,
+    'PayloadDescription': None,
+    'PayloadDisplayName': None,
+    'PayloadIdentifier': None,
+    'PayloadType': 'com.apple.mail.managed',
+    'PayloadUUID': None,
+    'PayloadVersion': 1,
+}
+_CONFIG_PAYLOAD = {
+    'PayloadContent': None,
+    'PayloadDisplayName': None,
+    'PayloadIdentifier': None,
+    'PayloadRemovalDisallowed': False,
+    'PayloadType': 'Configuration',
+    'PayloadUUID': None,
+    'PayloadVersion': 1,
+}
+# Value tags for all payload keys, see _TAGGED_ELEMENTS. Only values taken from the database are tagged 'x',
+# everything else is either constant or built from already expanded values.
+_PAYLOAD_TAGS = {
+    'EmailAccountDescription': 's',
+    'EmailAccountName': 's',
+    'EmailAccountType': 's',
+    'EmailAddress': 's',
+    'IncomingMailServerAuthentication': 's',
+    'IncomingMailServerHostName': 'x',
+    'IncomingMailServerPortNumber': 'i',
+    'IncomingMailServerUseSSL': 'b',
+    'IncomingMailServerUsername': 'x',
+    'OutgoingMailServerAuthentication': 's',
+    'OutgoingMailServerHostName': 'x',
+    'OutgoingMailServerPortNumber': 'i',
+    'OutgoingMailServerUseSSL': 'b',
+    'OutgoingMailServerUsername': 'x',
+    'OutgoingPasswordSameAsIncomingPassword': 'b',
+    'PayloadContent': 'L',
+    'PayloadDescription': 's',
+    'PayloadDisplayName': 's',
+    'PayloadIdentifier': 's',
+    'PayloadRemovalDisallowed': 'b',
+    'PayloadType': 's',
+    'PayloadUUID': 's',
+    'PayloadVersion': 'i',
+}
+# Complete, pre-encoded <key> elements for all payload keys.
+_KEY_BYTES = {k: _KEY_OPEN + escape(k).encode('utf-8') + _KEY_CLOSE for k in _PAYLOAD_TAGS}
 
 
-def _account_payload(local: str, domain: str, account_type: str, account_name: str) -> dict:
+def _account_payload(local: str, domain: str, account_type: str, account_name: str, uuid: str) -> dict:
     address = f'{local}@{domain}'
-    uuid = unique()
-    return {
-        'EmailAccountDescription': address,
-        'EmailAccountName': account_name,
-        'EmailAccountType': account_type,
-        'EmailAddress': address,
-        'IncomingMailServerAuthentication': 'EmailAuthPassword',
-        'IncomingMailServerHostName': None,
-        'IncomingMailServerPortNumber': -1,
-        'IncomingMailServerUseSSL': None,
-        'IncomingMailServerUsername': None,
-        'OutgoingMailServerAuthentication': 'EmailAuthPassword',
-        'OutgoingMailServerHostName': None,
-        'OutgoingMailServerPortNumber': -1,
-        'OutgoingMailServerUseSSL': None,
-        'OutgoingMailServerUsername': None,
-        'OutgoingPasswordSameAsIncomingPassword': True,
-        'PayloadDescription': f'Email account {address}',
-        'PayloadDisplayName': domain,
-        'PayloadIdentifier': f'com.apple.mail.managed.{uuid}',
-        'PayloadType': 'com.apple.mail.managed',
-        'PayloadUUID': uuid,
-        'PayloadVersion': 1,
-    }
-
-
-def _config_payload(domain: str, content: dict) -> dict:
-    uuid = unique()
-    return {
-        'PayloadContent': [content],
-        'PayloadDisplayName': f'Email account {domain}',
-        'PayloadIdentifier': branded_id(uuid),
-        'PayloadRemovalDisallowed': False,
-        'PayloadType': 'Configuration',
-        'PayloadUUID': uuid,
-        'PayloadVersion': 1,
-    }
-
-
-def _sanitise(data, local: str, domain: str):
-    for k, v in data.items():
-        if isinstance(v, list):
-            for members in v:
-                _sanitise(members, local, domain)
-        elif isinstance(v, dict):
-            _sanitise(v, local, domain)
-        elif isinstance(v, str):
-            new = expand_placeholders(v, local, domain)
-            data[k] = new
+    payload = _ACCOUNT_PAYLOAD.copy()
+    payload['EmailAccountDescription'] = address
+    payload['EmailAccountName'] = account_name
+    payload['EmailAccountType'] = account_type
+    payload['EmailAddress'] = address
+    payload['PayloadDescription'] = f'Email account {address}'
+    payload['PayloadDisplayName'] = domain
+    payload['PayloadIdentifier'] = f'com.apple.mail.managed.{uuid}'
+    payload['PayloadUUID'] = uuid
+    return payload
+
+
+def _config_payload(domain: str, content: list, uuid: str) -> dict:
+    payload = _CONFIG_PAYLOAD.copy()
+    payload['PayloadContent'] = [content]
+    payload['PayloadDisplayName'] = f'Email account {domain}'
+    payload['PayloadIdentifier'] = branded_id(uuid)
+    payload['PayloadUUID'] = uuid
+    return payload
+
+
+def _payload_items(payload: dict) -> list:
+    """Convert a payload dict into (key, tag, value) triples for _emit(), skipping 'None' values."""
+    return [(k, _PAYLOAD_TAGS[k], v) for (k, v) in payload.items() if v is not None]
 
 
 def _map_authentication(server: Server) -> str:
-    if server.authentication in AUTH_MAP:
+    try:
         return AUTH_MAP[server.authentication]
-    raise InvalidAuthenticationType(f'Invalid authentication type "{server.authentication}"')
+    except KeyError:
+        raise InvalidAuthenticationType(f'Invalid authentication type "{server.authentication}"')
+
+
+def _load_domain(domain_part: str) -> Domain:
+    """Fetch a domain with its provider, servers and LDAP server in as few queries as possible.
+    Results are cached for a short while, unless the database is changed by this process.
+    """
+    generation = data_generation()
+    domain = _domain_cache.get(domain_part, generation)
+    if domain is not None:
+        # Attach the cached instance to the current session without emitting SQL.
+        return db.session.merge(domain, load=False)
+    domain = db.session.execute(_DOMAIN_STMT, {'name': domain_part}).scalar_one_or_none()
+    if domain is not None:
+        # Unknown domains are not cached, as clients could otherwise fill the cache with arbitrary names.
+        _domain_cache.put(domain_part, generation, domain)
+    return domain
+
+
+def _server_key(server: Server) -> ServerKey:
+    return ServerKey(server.type, server.name, server.port, server.user_name, server.authentication,
+                     server.socket_type)
+
+
+@lru_cache(maxsize=_TEMPLATE_CACHE_SIZE)
+def _plist_template(domain_part: str, mail_server: ServerKey, smtp_server: ServerKey, has_cn: bool,
+                    has_uid: bool) -> bytes:
+    """Render the plist for a domain and its preferred servers. Values which vary between requests
+    are represented by sentinels, to be replaced using _fill_template().
+    """
+    account_name = TEMPLATE_REALNAME if has_cn else None
+    uid = TEMPLATE_UID if has_uid else None
+    account = _account_payload(TEMPLATE_LOCAL, domain_part, SERVER_TYPE_MAP[mail_server.type][1], account_name,
+                               TEMPLATE_ACCOUNT_UUID)
+    for server in [mail_server, smtp_server]:
+        host_k, port_k, user_k, auth_k, tls_k = SERVER_TYPE_KEYS[server.type]
+        account[host_k] = server.name
+        account[port_k] = server.port
+        account[user_k] = ConfigGenerator.pick_one(server.user_name, uid)
+        account[auth_k] = _map_authentication(server)
+        account[tls_k] = socket_type_needs_tls(server.socket_type)
+    config = _config_payload(domain_part, _payload_items(account), TEMPLATE_CONFIG_UUID)
+    buf = BytesIO()
+    buf.write(_PLIST_OPEN)
+    _emit(buf, _payload_items(config), TEMPLATE_LOCAL, domain_part)
+    buf.write(_PLIST_CLOSE)
+    return buf.getvalue()
+
+
+@lru_cache(maxsize=512)
+def _xml_text(value: str) -> bytes:
+    """Escape a string for use as XML character data. Results are cached because the same
+    local parts and display names tend to be requested repeatedly.
+    """
+    return escape(value).encode('utf-8')
+
+
+def _fill_template(template: bytes, values: dict) -> bytes:
+    """Replace all sentinels in a single pass, so that substituted values are never rescanned."""
+    return _template_re.sub(lambda match: values[match[0]], template)
 
 
 def _preferred_server(servers: List[Server], type_: str) -> Server:
@@ -169,9 +352,41 @@ def _preferred_server(servers: List[Server], type_: str) -> Server:
 
 
 class AppleGenerator(ConfigGenerator):
-    def client_config(self, local_part: str, domain_part: str, display_name: str) -> str:
-        root_element = Element('plist', attrib={'version': '1.0'})
-        domain: Domain = Domain.query.filter_by(name=domain_part).first()
+    def preferred_servers(self, domain: Domain) -> Tuple[Server, Server]:
+        """Return the preferred IMAP/POP server and the preferred SMTP server for a domain."""
+        servers = self.servers_by_prio(domain.servers)
+        mail_server = _preferred_server(servers, 'imap')
+        if not mail_server:
+            mail_server = _preferred_server(servers, 'pop')
+            if not mail_server:
+                raise NoServersForDomain(f'No IMAP/POP server for domain "{domain.name}"')
+        smtp_server = _preferred_server(servers, 'smtp')
+        if not smtp_server:  # pragma: no cover (not expected during testing)
+            raise NoServersForDomain(f'No SMTP server for domain "{domain.name}"')
+        return mail_server, smtp_server
+
+    def warm_up(self) -> int:
+        """Render the plist templates for all domains which do not use LDAP, so that requests do not
+        have to build any XML. At most as many domains as the template cache holds are fetched, because
+        preparing further domains would only evict templates prepared earlier. Returns the number of prepared domains.
+        """
+        count = 0
+        stmt = (select(Domain)
+                .where(Domain.ldapserver_id.is_(None), Domain.servers.any())
+                .options(selectinload(Domain.servers))
+                .limit(_TEMPLATE_CACHE_SIZE))
+        for domain in db.session.execute(stmt).scalars():
+            try:
+                mail_server, smtp_server = self.preferred_servers(domain)
+                _plist_template(domain.name, _server_key(mail_server), _server_key(smtp_server), True, False)
+                count += 1
+            except AutoMuaException as e:
+                log.warning(f'Cannot prepare Mobileconfig for domain "{domain.name}": {e}')
+        log.debug(f'Prepared Mobileconfig templates for {count} domain(s)')
+        return count
+
+    def client_config(self, local_part: str, domain_part: str, display_name: str) -> bytes:
+        domain: Domain = _load_domain(domain_part)
         if not domain:
             raise DomainNotFound(f'Domain "{domain_part}" not found')
         provider: Provider = domain.provider
@@ -184,24 +399,14 @@ class AppleGenerator(ConfigGenerator):
         else:
             lookup_result = LookupResult(STATUS_SUCCESS, display_name, None)
 
-        servers = self.servers_by_prio(domain.servers)
-        mail_server = _preferred_server(servers, 'imap')
-        if not mail_server:
-            mail_server = _preferred_server(servers, 'pop')
-            if not mail_server:
-                raise NoServersForDomain(f'No IMAP/POP server for domain "{domain_part}"')
-        smtp_server = _preferred_server(servers, 'smtp')
-        if not smtp_server:  # pragma: no cover (not expected during testing)
-            raise NoServersForDomain(f'No SMTP server for domain "{domain_part}"')
-        account = _account_payload(local_part, domain_part, SERVER_TYPE_MAP[mail_server.type][1], lookup_result.cn)
-        for server in [mail_server, smtp_server]:
-            direction = SERVER_TYPE_MAP[server.type][0]
-            account[f'{direction}MailServerHostName'] = server.name
-            account[f'{direction}MailServerPortNumber'] = server.port
-            account[f'{direction}MailServerUsername'] = self.pick_one(server.user_name, lookup_result.uid)
-            account[f'{direction}MailServerAuthentication'] = _map_authentication(server)
-            account[f'{direction}MailServerUseSSL'] = socket_type_needs_tls(server.socket_type)
-        config = _config_payload(domain_part, strip_none_values(account))
-        _sanitise(config, local_part, domain_part)
-        _subtree(root_element, '', config)
-        return xml_to_string(root_element)
+        mail_server, smtp_server = self.preferred_servers(domain)
+        template = _plist_template(domain_part, _server_key(mail_server), _server_key(smtp_server),
+                                   lookup_result.cn is not None, bool(lookup_result.uid))
+        values = {
+            _TEMPLATE_LOCAL_B: _xml_text(local_part),
+            _TEMPLATE_REALNAME_B: _xml_text(expand_placeholders(lookup_result.cn, local_part, domain_part)),
+            _TEMPLATE_UID_B: _xml_text(expand_placeholders(lookup_result.uid, local_part, domain_part)),
+            _TEMPLATE_ACCOUNT_UUID_B: unique().encode(),
+            _TEMPLATE_CONFIG_UUID_B: unique().encode(),
+        }
+        return _fill_template(template, values)
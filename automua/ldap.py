@@ -23,6 +23,10 @@ from collections import namedtuple
 
 from ldap3 import Connection
 from ldap3 import Server
+from ldap3.core.exceptions import LDAPException
+from ldap3.core.results import RESULT_NO_SUCH_OBJECT
+from ldap3.core.results import RESULT_SIZE_LIMIT_EXCEEDED
+from ldap3.core.results import RESULT_SUCCESS
 
 from automua import log
 
@@ -32,21 +36,37 @@ STATUS_NO_MATCH = 2
 
 LookupResult = namedtuple('LookupResult', 'status cn uid')
 
+# Search result codes which are answers, not failures. With size_limit=1, multiple matches yield sizeLimitExceeded.
+_SEARCH_RESULTS_OK = {RESULT_SUCCESS, RESULT_NO_SUCH_OBJECT, RESULT_SIZE_LIMIT_EXCEEDED}
+
 
 class LdapAccess:
-    def __init__(self, hostname, port=636, use_ssl=True, user=None, password=None) -> None:
+    def __init__(self, hostname, port=636, use_ssl=True, user=None, password=None, persistent=False) -> None:
+        """Persistent instances stay bound after a lookup, so they can be reused. Call close() when done."""
         self._server = Server(hostname, port=port, use_ssl=use_ssl)
         self._connection = Connection(self._server, lazy=False, read_only=True, user=user, password=password)
+        self._persistent = persistent
+
+    def close(self) -> None:
+        try:
+            if self._connection.bound:
+                self._connection.unbind()
+        except LDAPException as e:  # pragma: no cover (connection was already dropped)
+            log.debug(f'LDAP unbind failed: {e}')
 
     def lookup(self, search_base: str, search_filter: str, attr_uid='uid', attr_cn=None) -> LookupResult:
-        if not self._connection.bind():  # pragma: no cover (bind errors are not expected during unittests)
+        if not (self._connection.bound or self._connection.bind()):  # pragma: no cover (no bind errors in unittests)
             log.error(f'LDAP bind failed: {self._connection.result}')
             return LookupResult(STATUS_ERROR, None, None)
         attributes = [attr_uid]
         if attr_cn:
             attributes.append(attr_cn)
         self._connection.search(search_base, search_filter, attributes=attributes, size_limit=1)
-        if self._connection.response:
+        if self._connection.result['result'] not in _SEARCH_RESULTS_OK:
+            # Transient failures (busy, unavailable, time limit, ...) must not be mistaken for a non-match.
+            log.error(f'LDAP search failed: {self._connection.result}')
+            result = LookupResult(STATUS_ERROR, None, None)
+        elif self._connection.response:
             ldap_entry = self._connection.response[0]
             log.debug(f'LDAP match {ldap_entry["dn"]}')
             cn = self.get_attribute(ldap_entry, attr_cn)
@@ -55,7 +75,8 @@ class LdapAccess:
         else:
             log.warning(f'No LDAP match for filter {search_filter}')
             result = LookupResult(STATUS_NO_MATCH, None, None)
-        self._connection.unbind()
+        if not self._persistent:
+            self._connection.unbind()
         log.debug(result)
         return result
 
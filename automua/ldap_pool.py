@@ -0,0 +1,113 @@
+"""
+automua™ is a trademark of "Gaspard d'Hautefeuille" and may not be used
+by third parties without the prior written permission of the author.
+
+This file is part of automua.
+
+automua is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+automua is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with automua. If not, see <https://www.gnu.org/licenses/>.
+"""
+from hashlib import sha256
+from queue import Empty
+from queue import Full
+from queue import Queue
+from threading import Lock
+from typing import Callable
+from typing import Tuple
+
+from ldap3.core.exceptions import LDAPException
+
+from automua import log
+from automua.ldap import LdapAccess
+from automua.ldap import LookupResult
+from automua.ldap import STATUS_ERROR
+
+POOL_SIZE = 8
+
+# Pool ID -> (settings fingerprint, Queue of idle, bound LdapAccess instances)
+_pools = {}
+_pools_lock = Lock()
+
+
+def fingerprint(*settings) -> str:
+    """Return a digest of the given connection settings, so that credentials are not kept in plain text."""
+    return sha256(repr(settings).encode()).hexdigest()
+
+
+def _drain(pool: Queue) -> None:
+    while True:
+        try:
+            pool.get_nowait().close()
+        except Empty:
+            return
+
+
+def _pool(pool_id, digest: str) -> Queue:
+    with _pools_lock:
+        entry = _pools.get(pool_id)
+        if entry is not None and entry[0] == digest:
+            return entry[1]
+        pool = Queue(maxsize=POOL_SIZE)
+        _pools[pool_id] = (digest, pool)
+    if entry is not None:
+        # Connection settings have changed, idle connections are now stale.
+        _drain(entry[1])
+    return pool
+
+
+def acquire(pool_id, digest: str, factory: Callable[[], LdapAccess]) -> Tuple[LdapAccess, bool]:
+    """Return an idle connection for the given pool ID and settings fingerprint, or a new one created by factory.
+    The second tuple element is True if the connection was taken from the pool.
+    """
+    try:
+        return _pool(pool_id, digest).get_nowait(), True
+    except Empty:
+        return factory(), False
+
+
+def release(pool_id, digest: str, ldap: LdapAccess) -> None:
+    """Return a connection to its pool. Surplus connections and those with outdated settings are closed."""
+    with _pools_lock:
+        entry = _pools.setdefault(pool_id, (digest, Queue(maxsize=POOL_SIZE)))
+    if entry[0] != digest:
+        ldap.close()
+        return
+    try:
+        entry[1].put_nowait(ldap)
+    except Full:
+        ldap.close()
+
+
+def lookup(pool_id, digest: str, factory: Callable[[], LdapAccess], search_base: str, search_filter: str,
+           **kwargs) -> LookupResult:
+    """Perform an LDAP lookup using a pooled connection. Connections created by factory must be persistent."""
+    ldap, pooled = acquire(pool_id, digest, factory)
+    try:
+        result = ldap.lookup(search_base, search_filter, **kwargs)
+    except LDAPException as e:
+        ldap.close()
+        if not pooled:
+            raise
+        # Idle connections may have been dropped by the server, retry once using a new connection.
+        log.debug(f'Discarding pooled LDAP connection: {e}')
+        ldap = factory()
+        try:
+            result = ldap.lookup(search_base, search_filter, **kwargs)
+        except LDAPException:
+            ldap.close()
+            raise
+    if result.status == STATUS_ERROR:
+        ldap.close()
+    else:
+        release(pool_id, digest, ldap)
+    return result
@@ -22,10 +22,27 @@ along with automua. If not, see <https://www.gnu.org/licenses/>.
 """
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 from automua import PLACEHOLDER_ADDRESS
 
 db = SQLAlchemy()
+_data_generation = 0
+
+
+@event.listens_for(Engine, 'commit')
+def _bump_data_generation(conn) -> None:
+    global _data_generation
+    _data_generation += 1
+
+
+def data_generation() -> int:
+    """Return a counter which changes whenever this process commits a database transaction.
+    Caches of database content use it to detect changes.
+    """
+    return _data_generation
+
 
 davserver_domain_map = db.Table(
     'davserver_domain',
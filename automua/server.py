@@ -20,11 +20,17 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with automua. If not, see <https://www.gnu.org/licenses/>.
 """
+from threading import Lock
+from threading import Thread
+
 from flask import Flask
 from flask_migrate import Migrate
+from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+from automua import log
 from automua.config import config
+from automua.generators.apple import AppleGenerator
 from automua.model import db
 from automua.views import autoconfig
 from automua.views import autodiscover
@@ -38,6 +44,22 @@ MOZILLA_CONFIG_ROUTE = '/mail/config-v1.1.xml'
 MSOFT_ALTERNATE_ROUTE = '/AutoDiscover/AutoDiscover.xml'
 MSOFT_CONFIG_ROUTE = '/autodiscover/autodiscover.xml'
 
+
+def start_warm_up(app: Flask) -> Thread:
+    """Prepare Mobileconfig templates in a background thread, so that no request has to wait for it."""
+    def run() -> None:
+        with app.app_context():
+            try:
+                AppleGenerator().warm_up()
+            except SQLAlchemyError as e:
+                # The database may not be initialised yet.
+                log.debug(f'Skipping Mobileconfig warm-up: {e}')
+
+    thread = Thread(target=run, name='mobileconfig-warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
 def create_app():
     app = Flask(__name__)
     app.config['SQLALCHEMY_DATABASE_URI'] = config.db_uri()
@@ -61,4 +83,15 @@ def create_app():
     db.init_app(app)
     migrate = Migrate(app, db)
 
+    if config.warm_up():
+        # Deferred to the first request, so that CLI commands like "flask db upgrade" do not query the database.
+        warm_up_lock = Lock()
+        warm_up_started = []
+
+        @app.before_request
+        def warm_up() -> None:
+            with warm_up_lock:
+                if not warm_up_started:
+                    warm_up_started.append(start_warm_up(app))
+
     return app
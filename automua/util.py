@@ -22,7 +22,12 @@ along with automua. If not, see <https://www.gnu.org/licenses/>.
 """
 import os
 import re
-from uuid import uuid4
+from collections import deque
+from functools import lru_cache
+from string import Formatter
+from threading import Lock
+from time import monotonic
+from uuid import UUID
 
 from automua import InvalidEMailAddressError
 from automua import PLACEHOLDER_ADDRESS
@@ -30,7 +35,15 @@ from automua import PLACEHOLDER_DOMAIN
 from automua import PLACEHOLDER_LOCALPART
 from automua import log
 
+_UUID_BATCH_SIZE = 256
+_uuid_pool = deque()
+if hasattr(os, 'register_at_fork'):
+    # Forked workers must not hand out UUIDs which were pooled by their parent.
+    os.register_at_fork(after_in_child=_uuid_pool.clear)
+
 email_address_re = re.compile(r'^([^@]+)@([^@]+)$', re.IGNORECASE)
+placeholder_re = re.compile('|'.join(re.escape(p) for p in (PLACEHOLDER_ADDRESS, PLACEHOLDER_DOMAIN,
+                                                            PLACEHOLDER_LOCALPART)))
 
 
 def from_dict(data: dict, key: str, default: object = None):
@@ -54,20 +67,96 @@ def parse_email_address(address: str):
 
 
 def unique() -> str:
-    return uuid4().hex
+    """Return a random (version 4) UUID in hex format. Random bytes are read in batches."""
+    try:
+        return _uuid_pool.popleft()
+    except IndexError:
+        buf = os.urandom(16 * _UUID_BATCH_SIZE)
+        _uuid_pool.extend(UUID(bytes=buf[i:i + 16], version=4).hex for i in range(16, len(buf), 16))
+        return UUID(bytes=buf[:16], version=4).hex
 
 
 def expand_placeholders(string: str, local_part: str, domain_part: str) -> str:
     if not string:
         return ''
+    if '%' not in string:
+        return string
     placeholder_map = {
         PLACEHOLDER_ADDRESS: f'{local_part}@{domain_part}',
         PLACEHOLDER_DOMAIN: domain_part,
         PLACEHOLDER_LOCALPART: local_part,
     }
-    for k, v in placeholder_map.items():
-        string = string.replace(k, v)
-    return string
+    # Single pass, so placeholders contained in the substituted values are left alone.
+    return placeholder_re.sub(lambda match: placeholder_map[match[0]], string)
+
+
+@lru_cache(maxsize=64)
+def _search_filter_parts(search_filter: str):
+    """Split a search filter into the literal text surrounding its '{}' or '{0}' fields.
+    Returns None if the filter uses other str.format() features, or combinations of fields which
+    str.format() rejects when given a single argument: several '{}' fields, or '{}' mixed with '{0}'.
+    """
+    parts = []
+    fields = set()
+    literal = ''
+    for text, field, spec, conversion in Formatter().parse(search_filter):
+        literal += text
+        if field is None:
+            continue
+        if field not in ('', '0') or spec or conversion:
+            return None
+        if field == '' and fields:
+            return None
+        fields.add(field)
+        parts.append(literal)
+        literal = ''
+    if len(fields) > 1:
+        return None
+    parts.append(literal)
+    return tuple(parts)
+
+
+def format_search_filter(search_filter: str, email_address: str) -> str:
+    """Equivalent to search_filter.format(email_address), without parsing the filter every time."""
+    parts = _search_filter_parts(search_filter)
+    if parts is None:
+        return search_filter.format(email_address)
+    return email_address.join(parts)
+
+
+class TtlCache:
+    """Thread-safe cache for database-derived values. Entries expire after ttl seconds, or as soon as the
+    data generation they were stored with changes. Once the cache is full, the oldest entry is evicted.
+    """
+
+    def __init__(self, size: int, ttl: int) -> None:
+        # Key -> (expiry time, data generation, value), oldest entries first
+        self._entries = {}
+        self._lock = Lock()
+        self._size = size
+        self._ttl = ttl
+
+    def get(self, key, generation: int):
+        """Return the value cached for key, or None if it is missing or outdated."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] > monotonic() and entry[1] == generation:
+            return entry[2]
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+        return None
+
+    def put(self, key, generation: int, value) -> None:
+        if self._ttl <= 0:
+            return
+        with self._lock:
+            # Re-insert refreshed entries at the end, so eviction always removes the oldest one.
+            self._entries.pop(key, None)
+            if len(self._entries) >= self._size:
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = (monotonic() + self._ttl, generation, value)
 
 
 def socket_type_needs_tls(socket_type: str):
@@ -85,8 +174,3 @@ def socket_type_needs_tls(socket_type: str):
         """
         log.error(f'Unexpected socket type "{socket_type}" will cause a failure in future versions')
     return False
-
-
-def strip_none_values(data: dict) -> dict:
-    """Return copy of a dict containing only keys without 'None' values."""
-    return {k: v for (k, v) in data.items() if v is not None}
@@ -28,8 +28,10 @@ from flask import request
 from flask import url_for
 from flask.views import MethodView
 
+from automua.config import config
 from automua.database import populate_db
 from automua.database import purge_db
+from automua.generators.apple import AppleGenerator
 from automua.model import Provider
 from automua.model import db
 
@@ -49,6 +51,8 @@ class InitDatabase(MethodView):
         if pid == 0:
             populate_db(data)
             db.session.commit()
+            if config.warm_up():
+                AppleGenerator().warm_up()
             m = 'Database is now prepared'
         else:  # pragma: no cover
             m = 'Database already contains provider data'
@@ -22,11 +22,13 @@ along with automua. If not, see <https://www.gnu.org/licenses/>.
 """
 import unittest
 from typing import List
+from unittest.mock import patch
 from xml.dom import minidom
 from xml.dom.minidom import Element
 
 from automua import InvalidAuthenticationType
 from automua import PLACEHOLDER_ADDRESS
+from automua.config import config
 from automua.database import EGGS_DOMAIN
 from automua.database import EXAMPLE_COM
 from automua.database import EXAMPLE_NET
@@ -34,8 +36,12 @@ from automua.database import EXAMPLE_ORG
 from automua.database import SERVERLESS_DOMAIN
 from automua.database import sample_server_names
 from automua.model import Server
+from automua.model import db
 from automua.server import APPLE_CONFIG_ROUTE
+from automua.server import create_app
+from automua.server import start_warm_up
 from automua.util import unique
+from automua.views import EMAIL_MOZILLA
 from automua.views.mobileconfig import CONTENT_TYPE_APPLE
 from tests.base import TestCase
 from tests.base import body
@@ -105,6 +111,60 @@ class AppleRoutes(TestCase):
             x = self.smtp_server_names(minidom.parseString(body(r)))
             self.assertEqual(sample_server_names['smtp1'], x[0])
 
+    def test_apple_template_per_user(self):
+        with self.app:
+            r1 = self.get(f'{APPLE_CONFIG_ROUTE}?{EMAIL_MOZILLA}=a@{EXAMPLE_COM}&name=A%20%26%20B')
+            r2 = self.get(f'{APPLE_CONFIG_ROUTE}?{EMAIL_MOZILLA}=b@{EXAMPLE_COM}&name={{{{LOCAL}}}}')
+            md1 = minidom.parseString(body(r1))
+            md2 = minidom.parseString(body(r2))
+            self.assert_kv(md1, 'EmailAddress', f'a@{EXAMPLE_COM}')
+            self.assert_kv(md1, 'EmailAccountName', 'A & B')
+            self.assert_kv(md2, 'EmailAddress', f'b@{EXAMPLE_COM}')
+            self.assert_kv(md2, 'EmailAccountName', '{{LOCAL}}')
+            self.assertNotEqual(body(r1).split('PayloadUUID')[1], body(r2).split('PayloadUUID')[1])
+
+    def test_apple_cache_invalidated_by_commit(self):
+        with self.app:
+            r = self.get_apple_config(f'a@{EXAMPLE_COM}')
+            self.assert_kv(minidom.parseString(body(r)), 'OutgoingMailServerHostName', sample_server_names['smtp1'])
+            with self.app.application.app_context():
+                server = Server.query.filter_by(name=sample_server_names['smtp1']).one()
+                server.name = 'changed.smtp.tld'
+                db.session.commit()
+            r = self.get_apple_config(f'a@{EXAMPLE_COM}')
+            self.assert_kv(minidom.parseString(body(r)), 'OutgoingMailServerHostName', 'changed.smtp.tld')
+
+    def test_apple_unknown_domains_not_cached(self):
+        from automua.generators.apple import _domain_cache
+        from automua.model import data_generation
+        with self.app:
+            for i in range(10):
+                domain = f'nx{i}.{unique()}.tld'
+                r = self.get_apple_config(f'a@{domain}')
+                self.assertEqual(204, r.status_code)
+                self.assertIsNone(_domain_cache.get(domain, data_generation()))
+
+    def test_apple_warm_up(self):
+        from automua.generators.apple import AppleGenerator, _plist_template
+        with self.app:
+            with self.app.application.app_context():
+                self.assertGreater(AppleGenerator().warm_up(), 0)
+            hits = _plist_template.cache_info().hits
+            r = self.get_apple_config(f'a@{EXAMPLE_COM}')
+            self.assertEqual(200, r.status_code)
+            self.assertEqual(hits + 1, _plist_template.cache_info().hits)
+
+    def test_apple_warm_up_capped(self):
+        from automua.generators import apple
+        size = apple._TEMPLATE_CACHE_SIZE
+        apple._TEMPLATE_CACHE_SIZE = 1
+        try:
+            with self.app:
+                with self.app.application.app_context():
+                    self.assertEqual(1, apple.AppleGenerator().warm_up())
+        finally:
+            apple._TEMPLATE_CACHE_SIZE = size
+
     def test_domain_without_servers(self):
         with self.app:
             r = self.get_apple_config(f'a@{SERVERLESS_DOMAIN}')
@@ -115,28 +175,25 @@ class AppleRoutes(TestCase):
             r = self.get_apple_config(f'a@{EGGS_DOMAIN}')
             self.assertEqual(400, r.status_code)
 
-    def test_sanitise_dict(self):
-        from automua.generators.apple import _sanitise
-        with self.app:
-            d1 = {'b': PLACEHOLDER_ADDRESS}
-            d2 = {'a': d1}
-            _sanitise(d2, 'x', 'y')
-            self.assertEqual('x@y', d1['b'])
-
-    def test_sanitise_valid(self):
-        from automua.generators.apple import _sanitise
-        with self.app:
-            d = {'a': PLACEHOLDER_ADDRESS}
-            _sanitise(d, 'l', 'd')
-            self.assertEqual('l@d', d['a'])
-
-    def test_strip_none_values(self):
-        from automua.util import strip_none_values
-        with self.app:
-            b = unique()
-            d = strip_none_values({'a': None, 'b': b})
-            self.assertEqual(len(d.items()), 1)
-            self.assertEqual(b, d['b'])
+    def test_emit_expands_nested(self):
+        from io import BytesIO
+        from automua.generators.apple import _emit
+        buf = BytesIO()
+        _emit(buf, [('b', 'x', PLACEHOLDER_ADDRESS), ('c', 'L', [[('d', 'x', PLACEHOLDER_ADDRESS)]])], 'x', 'y')
+        self.assertEqual(b'<dict><key>b</key><string>x@y</string><key>c</key>'
+                         b'<array><dict><key>d</key><string>x@y</string></dict></array></dict>', buf.getvalue())
+
+    def test_emit_literal_string(self):
+        from io import BytesIO
+        from automua.generators.apple import _emit
+        buf = BytesIO()
+        _emit(buf, [('a', 's', PLACEHOLDER_ADDRESS)], 'x', 'y')
+        self.assertEqual(f'<dict><key>a</key><string>{PLACEHOLDER_ADDRESS}</string></dict>'.encode(), buf.getvalue())
+
+    def test_payload_items(self):
+        from automua.generators.apple import _payload_items
+        items = _payload_items({'PayloadUUID': 'u', 'EmailAccountName': None, 'PayloadVersion': 1})
+        self.assertEqual([('PayloadUUID', 's', 'u'), ('PayloadVersion', 'i', 1)], items)
 
     def test_map_bad_auth(self):
         from automua.generators.apple import _map_authentication
@@ -165,5 +222,34 @@ class AppleRoutes(TestCase):
             self.assertEqual(3, _preferred_server(servers, 'smtp').id)
 
 
+class WarmUpHook(TestCase):
+    """Tests for the optional Mobileconfig warm-up on the first request."""
+
+    @staticmethod
+    def warm_up_app(enabled: bool):
+        with patch.object(config, 'warm_up', return_value=enabled):
+            return create_app()
+
+    def test_warm_up_started_once(self):
+        app = self.warm_up_app(True)
+        with patch('automua.server.start_warm_up') as start:
+            client = app.test_client()
+            client.get('/')
+            client.get('/')
+        start.assert_called_once_with(app)
+
+    def test_warm_up_disabled(self):
+        app = self.warm_up_app(False)
+        with patch('automua.server.start_warm_up') as start:
+            app.test_client().get('/')
+        start.assert_not_called()
+
+    def test_warm_up_in_background(self):
+        from automua.generators.apple import _plist_template
+        _plist_template.cache_clear()
+        start_warm_up(self.app.application).join()
+        self.assertGreater(_plist_template.cache_info().currsize, 0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -20,9 +20,19 @@ You should have received a copy of the GNU General Public License
 along with automua. If not, see <https://www.gnu.org/licenses/>.
 """
 import unittest
+from unittest.mock import patch
+
+from ldap3.core.results import RESULT_ADMIN_LIMIT_EXCEEDED
+from ldap3.core.results import RESULT_BUSY
+from ldap3.core.results import RESULT_NO_SUCH_OBJECT
+from ldap3.core.results import RESULT_SIZE_LIMIT_EXCEEDED
+from ldap3.core.results import RESULT_SUCCESS
+from ldap3.core.results import RESULT_TIME_LIMIT_EXCEEDED
+from ldap3.core.results import RESULT_UNAVAILABLE
 
 from automua import LdapLookupError
 from automua import LdapNoMatch
+from automua.config import config
 from automua.generators.apple import AppleGenerator
 from automua.generators.mozilla import MozillaGenerator
 from automua.generators.outlook import OutlookGenerator
@@ -109,11 +119,114 @@ class LdapTests(TestCase):
             with self.assertRaises(LdapNoMatch):
                 gen.ldap_lookup(self.UNIQUE, server)
 
+    def test_generator_ldap_cached(self):
+        from automua.generators import _ldap_cache
+        from automua.model import data_generation
+        with app.app_context():
+            server = Ldapserver.query.filter_by(id=LDAP_PORT).one()
+            gen = MozillaGenerator()
+            x = gen.ldap_lookup(self.EXISTS_EMAIL, server)
+            self.assertEqual(x, _ldap_cache.get((server.id, self.EXISTS_EMAIL), data_generation()))
+            self.assertEqual(x, gen.ldap_lookup(self.EXISTS_EMAIL, server))
+
     def test_mozilla_generator_ldap_missing_server(self):
         with self.assertRaises(LdapLookupError):
             gen = MozillaGenerator()
             gen.ldap_lookup(self.UNIQUE, None)
 
 
+class FakeConnection:
+    """Stands in for an ldap3 Connection, returning a fixed search result."""
+
+    def __init__(self, result_code: int, response: list) -> None:
+        self.bound = True
+        self.result = {'result': result_code}
+        self.response = response
+
+    def search(self, search_base, search_filter, **kwargs) -> bool:
+        return self.result['result'] == RESULT_SUCCESS
+
+    def unbind(self) -> None:
+        self.bound = False
+
+
+class LdapResultTests(unittest.TestCase):
+    """Tests for the interpretation of LDAP search results, which do not need an LDAP server."""
+    ENTRY = {'dn': 'uid=jd,dc=example,dc=com', 'attributes': {'uid': ['jd'], 'cn': ['John Doe']}}
+
+    def lookup(self, result_code: int, response: list) -> LookupResult:
+        ldap = LdapAccess('localhost', port=389, use_ssl=False)
+        ldap._connection = FakeConnection(result_code, response)
+        return ldap.lookup('dc=example,dc=com', '(mail=a@example.com)', attr_cn='cn')
+
+    def test_success(self):
+        self.assertEqual(LookupResult(STATUS_SUCCESS, 'John Doe', 'jd'), self.lookup(RESULT_SUCCESS, [self.ENTRY]))
+
+    def test_size_limit_exceeded(self):
+        x = self.lookup(RESULT_SIZE_LIMIT_EXCEEDED, [self.ENTRY])
+        self.assertEqual(STATUS_SUCCESS, x.status)
+
+    def test_no_match(self):
+        self.assertEqual(STATUS_NO_MATCH, self.lookup(RESULT_SUCCESS, []).status)
+        self.assertEqual(STATUS_NO_MATCH, self.lookup(RESULT_NO_SUCH_OBJECT, []).status)
+
+    def test_search_failed(self):
+        for code in [RESULT_BUSY, RESULT_UNAVAILABLE, RESULT_TIME_LIMIT_EXCEEDED, RESULT_ADMIN_LIMIT_EXCEEDED]:
+            self.assertEqual(STATUS_ERROR, self.lookup(code, []).status)
+
+
+class LdapCacheTests(unittest.TestCase):
+    """Tests for caching of LDAP lookups by generators, which do not need an LDAP server."""
+    SERVER = Ldapserver(id=-1, name='ldap.example.com', port=389, use_ssl=False, search_base='dc=example,dc=com',
+                        search_filter='(mail={})', attr_uid='uid', attr_cn='cn')
+
+    def setUp(self) -> None:
+        self.email = f'{unique()}@example.com'
+
+    def lookup(self, *results: LookupResult):
+        """Return a mock replacing the pooled LDAP lookup, yielding the given results in turn."""
+        return patch('automua.generators.ldap_pool.lookup', side_effect=results)
+
+    def test_match_cached(self):
+        result = LookupResult(STATUS_SUCCESS, 'John Doe', 'jd')
+        with self.lookup(result) as lookup:
+            self.assertEqual(result, MozillaGenerator.ldap_lookup(self.email, self.SERVER))
+            self.assertEqual(result, MozillaGenerator.ldap_lookup(self.email, self.SERVER))
+        self.assertEqual(1, lookup.call_count)
+
+    def test_no_match_cached(self):
+        with self.lookup(LookupResult(STATUS_NO_MATCH, None, None)) as lookup:
+            for _ in range(2):
+                with self.assertRaises(LdapNoMatch):
+                    MozillaGenerator.ldap_lookup(self.email, self.SERVER)
+        self.assertEqual(1, lookup.call_count)
+
+    def test_error_not_cached(self):
+        error = LookupResult(STATUS_ERROR, None, None)
+        with self.lookup(error, error) as lookup:
+            for _ in range(2):
+                with self.assertRaises(LdapLookupError):
+                    MozillaGenerator.ldap_lookup(self.email, self.SERVER)
+        self.assertEqual(2, lookup.call_count)
+
+    def test_generation_invalidates(self):
+        result = LookupResult(STATUS_SUCCESS, None, 'jd')
+        with self.lookup(result, result) as lookup:
+            with patch('automua.generators.data_generation', return_value=1):
+                MozillaGenerator.ldap_lookup(self.email, self.SERVER)
+            with patch('automua.generators.data_generation', return_value=2):
+                MozillaGenerator.ldap_lookup(self.email, self.SERVER)
+        self.assertEqual(2, lookup.call_count)
+
+    def test_ttl_expiry(self):
+        result = LookupResult(STATUS_SUCCESS, None, 'jd')
+        with self.lookup(result, result) as lookup:
+            with patch('automua.util.monotonic', return_value=1000.0):
+                MozillaGenerator.ldap_lookup(self.email, self.SERVER)
+            with patch('automua.util.monotonic', return_value=1000.0 + config.cache_ttl()):
+                MozillaGenerator.ldap_lookup(self.email, self.SERVER)
+        self.assertEqual(2, lookup.call_count)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,114 @@
+"""
+automua™ is a trademark of "Gaspard d'Hautefeuille" and may not be used
+by third parties without the prior written permission of the author.
+
+This file is part of automua.
+
+automua is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+automua is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with automua. If not, see <https://www.gnu.org/licenses/>.
+"""
+import unittest
+
+from ldap3.core.exceptions import LDAPSocketReceiveError
+
+from automua import ldap_pool
+from automua.ldap import LookupResult
+from automua.ldap import STATUS_ERROR
+from automua.ldap import STATUS_SUCCESS
+from automua.util import unique
+
+DIGEST = ldap_pool.fingerprint('ldap.example.com', 389, False, 'user', 'password')
+
+
+class FakeAccess:
+    """Stands in for LdapAccess, returning a fixed lookup result."""
+
+    def __init__(self, status=STATUS_SUCCESS, fail=False) -> None:
+        self.status = status
+        self.fail = fail
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+    def lookup(self, search_base: str, search_filter: str, **kwargs) -> LookupResult:
+        if self.fail:
+            raise LDAPSocketReceiveError('connection dropped')
+        return LookupResult(self.status, None, search_filter)
+
+
+class LdapPoolTests(unittest.TestCase):
+    """Tests for LDAP connection pooling."""
+
+    def test_connection_reused(self):
+        key = unique()
+        created = []
+
+        def factory():
+            created.append(FakeAccess())
+            return created[-1]
+
+        for _ in range(3):
+            r = ldap_pool.lookup(key, DIGEST, factory, 'base', 'filter')
+            self.assertEqual(STATUS_SUCCESS, r.status)
+        self.assertEqual(1, len(created))
+
+    def test_error_not_pooled(self):
+        key = unique()
+        ldap = FakeAccess(status=STATUS_ERROR)
+        ldap_pool.lookup(key, DIGEST, lambda: ldap, 'base', 'filter')
+        self.assertTrue(ldap.closed)
+        _, pooled = ldap_pool.acquire(key, DIGEST, FakeAccess)
+        self.assertFalse(pooled)
+
+    def test_stale_connection_replaced(self):
+        key = unique()
+        stale = FakeAccess(fail=True)
+        ldap_pool.release(key, DIGEST, stale)
+        r = ldap_pool.lookup(key, DIGEST, FakeAccess, 'base', 'filter')
+        self.assertEqual(STATUS_SUCCESS, r.status)
+        self.assertTrue(stale.closed)
+
+    def test_pool_size_limit(self):
+        key = unique()
+        connections = [FakeAccess() for _ in range(ldap_pool.POOL_SIZE + 1)]
+        for ldap in connections:
+            ldap_pool.release(key, DIGEST, ldap)
+        self.assertTrue(connections[-1].closed)
+        self.assertFalse(connections[0].closed)
+
+    def test_retry_connection_closed_on_error(self):
+        key = unique()
+        ldap_pool.release(key, DIGEST, FakeAccess(fail=True))
+        retry = FakeAccess(fail=True)
+        with self.assertRaises(LDAPSocketReceiveError):
+            ldap_pool.lookup(key, DIGEST, lambda: retry, 'base', 'filter')
+        self.assertTrue(retry.closed)
+
+    def test_changed_settings_drain_pool(self):
+        key = unique()
+        old = FakeAccess()
+        ldap_pool.release(key, DIGEST, old)
+        changed = ldap_pool.fingerprint('ldap.example.com', 389, False, 'user', 'new password')
+        ldap, pooled = ldap_pool.acquire(key, changed, FakeAccess)
+        self.assertFalse(pooled)
+        self.assertTrue(old.closed)
+        ldap_pool.release(key, DIGEST, ldap)
+        self.assertTrue(ldap.closed)
+
+    def test_fingerprint_hides_password(self):
+        self.assertNotIn('password', ldap_pool.fingerprint('ldap.example.com', 389, False, 'user', 'password'))
+
+
+if __name__ == '__main__':
+    unittest.main()
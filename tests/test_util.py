@@ -22,12 +22,16 @@ along with automua. If not, see <https://www.gnu.org/licenses/>.
 """
 import os
 import unittest
+from unittest.mock import patch
+from uuid import UUID
 
 from automua import InvalidEMailAddressError
 from automua import PLACEHOLDER_ADDRESS
 from automua import PLACEHOLDER_DOMAIN
 from automua import PLACEHOLDER_LOCALPART
+from automua.util import TtlCache
 from automua.util import expand_placeholders
+from automua.util import format_search_filter
 from automua.util import from_dict
 from automua.util import from_environ
 from automua.util import parse_email_address
@@ -84,6 +88,65 @@ class UtilTests(unittest.TestCase):
         self.assertEqual('3a4', expand_placeholders(f'3{PLACEHOLDER_LOCALPART}4', local, domain))
         self.assertEqual('5b.c6', expand_placeholders(f'5{PLACEHOLDER_DOMAIN}6', local, domain))
 
+    def test_expand_single_pass(self):
+        self.assertEqual(f'{PLACEHOLDER_DOMAIN}@b.c', expand_placeholders(PLACEHOLDER_ADDRESS, PLACEHOLDER_DOMAIN, 'b.c'))
+        self.assertEqual('no placeholders', expand_placeholders('no placeholders', 'a', 'b.c'))
+
+    def test_search_filter(self):
+        for f in ['(mail={})', '(mail={0})', '(|(mail={0})(alias={0}))', '(uid=x)', '({{x}}={0})', '(mail={0!r})']:
+            self.assertEqual(f.format('a@b.c'), format_search_filter(f, 'a@b.c'))
+
+    def test_search_filter_invalid(self):
+        for f, e in [('(|(mail={})(alias={}))', IndexError), ('(|(mail={})(alias={0}))', ValueError),
+                     ('(|(mail={0})(alias={}))', ValueError)]:
+            with self.assertRaises(e):
+                f.format('a@b.c')
+            with self.assertRaises(e):
+                format_search_filter(f, 'a@b.c')
+
+    def test_unique(self):
+        values = {unique() for _ in range(1000)}
+        self.assertEqual(1000, len(values))
+        for value in values:
+            self.assertEqual(4, UUID(hex=value).version)
+
+    def test_ttl_cache_hit(self):
+        cache = TtlCache(2, 60)
+        cache.put('a', 1, 'A')
+        self.assertEqual('A', cache.get('a', 1))
+        self.assertIsNone(cache.get('b', 1))
+
+    def test_ttl_cache_generation(self):
+        cache = TtlCache(2, 60)
+        cache.put('a', 1, 'A')
+        self.assertIsNone(cache.get('a', 2))
+        self.assertIsNone(cache.get('a', 1))
+
+    def test_ttl_cache_expiry(self):
+        cache = TtlCache(2, 60)
+        with patch('automua.util.monotonic', return_value=1000.0):
+            cache.put('a', 1, 'A')
+        with patch('automua.util.monotonic', return_value=1059.0):
+            self.assertEqual('A', cache.get('a', 1))
+        with patch('automua.util.monotonic', return_value=1060.0):
+            self.assertIsNone(cache.get('a', 1))
+
+    def test_ttl_cache_evicts_oldest(self):
+        cache = TtlCache(2, 60)
+        cache.put('a', 1, 'A')
+        cache.put('b', 1, 'B')
+        # Refreshing 'a' makes 'b' the oldest entry.
+        cache.put('a', 1, 'A2')
+        cache.put('c', 1, 'C')
+        self.assertEqual('A2', cache.get('a', 1))
+        self.assertIsNone(cache.get('b', 1))
+        self.assertEqual('C', cache.get('c', 1))
+
+    def test_ttl_cache_disabled(self):
+        cache = TtlCache(2, 0)
+        cache.put('a', 1, 'A')
+        self.assertIsNone(cache.get('a', 1))
+
     def test_needs_tls(self):
         self.assertTrue(socket_type_needs_tls('SSL'))
         self.assertTrue(socket_type_needs_tls('TLS'))